@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
-import argparse, csv, os, json, re
-from collections import OrderedDict
-from typing import List, Dict, Tuple, Set, Optional
+import argparse, csv, os, json, re, sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Set, Optional, Iterable, Iterator
 
 try:
     import yaml
@@ -19,165 +19,311 @@ def load_config(path: str) -> dict:
     return json.loads(txt)
 
 
-def read_csv_keep_order(path: str) -> Tuple[List[str], List[OrderedDict]]:
+STREAM_CHUNK_ROWS = 10000
+UNMAPPED_SAMPLE_LIMIT = 20
+WRITE_BUFFER_BYTES = 1 << 20
+
+
+def peek_csv(path: str) -> Tuple[List[str], Dict[str, int], bool]:
+    """Return (headers, col_index, has_rows) reading only up to the first non-blank data row."""
     with open(path, "r", encoding="utf-8-sig", newline="") as f:
-        rdr = csv.DictReader(f)
-        headers = rdr.fieldnames or []
-        rows: List[OrderedDict] = []
-        for r in rdr:
-            rows.append(OrderedDict((h, (r.get(h, "") if r.get(h, "") is not None else "")) for h in headers))
-        return headers, rows
+        rdr = csv.reader(f)
+        headers = next(rdr, [])
+        if headers:
+            headers[0] = headers[0].lstrip("\ufeff")
+        headers = [sys.intern(h) for h in headers]
+        col_index = {h: i for i, h in enumerate(headers)}
+        has_rows = any(row for row in rdr)
+        return headers, col_index, has_rows
+
+
+def iter_csv_rows(path: str) -> Iterator[List[str]]:
+    """
+    Yield data rows one at a time as plain lists aligned to the header row (which is not yielded).
+    Short rows are padded with "", extra trailing fields are dropped and blank lines skipped (as DictReader did).
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rdr = csv.reader(f)
+        n = len(next(rdr, []))
+        for row in rdr:
+            if not row:
+                continue
+            if len(row) < n:
+                row += [""] * (n - len(row))
+            elif len(row) > n:
+                del row[n:]
+            yield row
+
 
+def iter_chunks(rows: Iterable[List[str]], size: int) -> Iterator[List[List[str]]]:
+    """Group rows into lists of at most `size` rows."""
+    chunk: List[List[str]] = []
+    for r in rows:
+        chunk.append(r)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_csv_keep_order(path: str) -> Tuple[List[str], Dict[str, int], List[List[str]]]:
+    """Read a whole CSV as (headers, col_index, rows); see iter_csv_rows for row normalization."""
+    headers, col_index, _ = peek_csv(path)
+    return headers, col_index, list(iter_csv_rows(path))
 
-def write_csv_exact_headers(path: str, headers: List[str], rows: List[OrderedDict]):
+
+def write_csv_exact_headers(path: str, headers: List[str], rows: Iterable[List[str]]):
+    """
+    Write headers + rows with csv.writer's default (excel) dialect. Rows that need no quoting
+    (no delimiter, quote or newline in any cell) are joined directly; the rest go through csv.writer.
+    """
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=headers, extrasaction="ignore")
-        w.writeheader()
+    with open(path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER_BYTES) as f:
+        w = csv.writer(f)
+        w.writerow(headers)
+        delim = w.dialect.delimiter
+        eol = w.dialect.lineterminator
+        write = f.write
+        writerow = w.writerow
         for r in rows:
-            w.writerow({h: ("" if r.get(h) is None else r.get(h)) for h in headers})
+            line = delim.join(r)
+            # An extra delimiter in the joined line means some cell contained one; a lone empty
+            # cell must be written as "" so it is not read back as a blank line.
+            if not line or '"' in line or "\n" in line or "\r" in line or line.count(delim) != len(r) - 1:
+                writerow(r)
+            else:
+                write(line + eol)
 
 
 def build_mapping(d: Optional[dict]) -> Dict[str, str]:
-    """For IDs, use exact/trim-only matching—no lowercasing (IDs can be case-sensitive)."""
+    """
+    For IDs, use exact/trim-only matching—no lowercasing (IDs can be case-sensitive).
+    Keys and values are interned: the key set is small and probed once per cell.
+    """
     if not d:
         return {}
     m: Dict[str, str] = {}
     for k, v in d.items():
         if k is None:
             continue
-        m[str(k).strip()] = "" if v is None else str(v).strip()
+        m[sys.intern(str(k).strip())] = sys.intern("" if v is None else str(v).strip())
     return m
 
 
-def map_value_exact(val: str, mapping: Dict[str, str]) -> Tuple[str, bool]:
-    """Map by exact or trimmed key only; return (new_value, did_map)."""
-    if val is None:
-        return "", False
-    raw = str(val)
-    if raw in mapping:
-        return mapping[raw], True
-    trimmed = raw.strip()
-    if trimmed in mapping:
-        return mapping[trimmed], True
-    return raw, False
+_MULTI_SPLIT = re.compile(r'(\s*[;,|]\s*)')
 
 
-def map_multivalue_cell_preserve_separators(cell: str, mapping: Dict[str, str]) -> Tuple[str, bool]:
+def split_multivalue_cell(cell: str) -> List[str]:
+    """
+    _MULTI_SPLIT.split(cell): [token, separator, token, ...] with each separator keeping
+    its surrounding whitespace. Cells without any separator skip the regex.
+    """
+    if "," not in cell and ";" not in cell and "|" not in cell:
+        return [cell]
+    return _MULTI_SPLIT.split(cell)
+
+
+def map_multivalue_cell_preserve_separators(cell: str, mapping: Dict[str, str]) -> Tuple[str, bool, Optional[str]]:
     """
     Map tokens inside a multi-value cell while preserving original separators/spaces.
     Splits on , ; | with surrounding spaces kept as separate parts.
+    Returns (new_cell, did_any, first_unmapped_token_or_None).
     """
     if not cell:
-        return cell, False
-    parts = re.split(r'(\s*[;,|]\s*)', cell)
+        return cell, False, None
+    parts = split_multivalue_cell(cell)
     changed = False
+    first_unmapped: Optional[str] = None
     for i in range(0, len(parts), 2):
         token = parts[i]
-        if token.strip() == "":
+        trimmed = token.strip()
+        if trimmed == "":
             continue
-        new, did = map_value_exact(token, mapping)
-        if did:
-            parts[i] = new
-            changed = True
-    return "".join(parts), changed
-
-
-def apply_column_value_mapping(
-    rows: List[OrderedDict],
-    columns: List[str],
-    mapping: Dict[str, str],
-    forbid_columns: Set[str] = frozenset()
-) -> Tuple[int, Set[str]]:
-    """
-    Map values only in the specified columns (headers unchanged).
-    Returns (rows_changed_count, unmapped_samples_set)
-    """
-    if not rows or not columns or not mapping:
-        return 0, set()
-
-    changed_rows = 0
-    unmapped_samples: Set[str] = set()
-
-    present_cols = [c for c in columns if rows and c in rows[0]]
-    target_cols = [c for c in present_cols if c not in forbid_columns]
+        if token in mapping:
+            parts[i] = mapping[token]
+        elif trimmed in mapping:
+            parts[i] = mapping[trimmed]
+        else:
+            if first_unmapped is None:
+                first_unmapped = trimmed
+            continue
+        changed = True
+    return "".join(parts), changed, first_unmapped
 
-    for r in rows:
-        row_changed = False
-        for col in target_cols:
-            val = r.get(col, "")
-            if val != "":
-                new, did = map_value_exact(val, mapping)
-                if did:
-                    r[col] = new
-                    row_changed = True
-                else:
-                    if len(unmapped_samples) < 20:
-                        unmapped_samples.add(str(val))
-        if row_changed:
-            changed_rows += 1
 
-    return changed_rows, unmapped_samples
+def column_indices(col_index: Dict[str, int], columns: List[str], forbid_columns: Set[str] = frozenset()) -> List[int]:
+    """Positions of the given columns that exist in the headers, skipping forbidden ones (resolved once per file)."""
+    return [col_index[c] for c in columns if c in col_index and c not in forbid_columns]
 
 
 def apply_multivalue_mapping(
-    rows: List[OrderedDict],
-    columns: List[str],
+    rows: List[List[str]],
+    col_indices: List[int],
     mapping: Dict[str, str]
 ) -> Tuple[int, Set[str]]:
     """Map values inside multi-value cells; returns (rows_changed_count, unmapped_token_samples)."""
-    if not rows or not columns or not mapping:
+    if not rows or not col_indices or not mapping:
         return 0, set()
 
     changed_rows = 0
     unmapped_samples: Set[str] = set()
-
-    present_cols = [c for c in columns if rows and c in rows[0]]
+    samples_full = False
 
     for r in rows:
         row_changed = False
-        for col in present_cols:
-            val = r.get(col, "")
+        for idx in col_indices:
+            val = r[idx]
             if val == "":
                 continue
-            new_cell, did_any = map_multivalue_cell_preserve_separators(val, mapping)
+            new_cell, did_any, first_unmapped = map_multivalue_cell_preserve_separators(val, mapping)
             if did_any:
-                r[col] = new_cell
+                r[idx] = new_cell
                 row_changed = True
-            else:
-                tokens = [t for t in re.split(r'[;,|]', val) if t.strip()]
-                for tok in tokens:
-                    if tok.strip() not in mapping and len(unmapped_samples) < 20:
-                        unmapped_samples.add(tok.strip())
-                        break
+            elif first_unmapped and not samples_full:
+                unmapped_samples.add(first_unmapped)
+                samples_full = len(unmapped_samples) >= UNMAPPED_SAMPLE_LIMIT
         if row_changed:
             changed_rows += 1
 
     return changed_rows, unmapped_samples
 
 
-def build_id_map_sequential(rows: List[OrderedDict], id_col: str, start_at: int) -> Dict[str, str]:
+def build_id_map_sequential(rows: Iterable[List[str]], col_index: Dict[str, int], id_col: str, start_at: int) -> Dict[str, str]:
     """
     Build a mapping old_id -> new_id using a simple sequence:
     First occurrence gets start_at, next gets start_at+1, etc. (order of rows).
     All references to the same old_id will map to the same new_id.
+    Cells in rows from iter_csv_rows/read_csv_keep_order are always str, so ids are only
+    trimmed (strip() returns the same object when there is nothing to trim).
     """
     mapping: Dict[str, str] = {}
     current = start_at
+    idx = col_index[id_col]
     for r in rows:
-        old = str(r.get(id_col, "")).strip()
+        old = r[idx].strip()
         if old not in mapping:
             mapping[old] = str(current)
             current += 1
     return mapping
 
 
-def remap_column_using_map(rows: List[OrderedDict], col: str, id_map: Dict[str, str]):
+def remap_column_using_map(rows: List[List[str]], col_index: Dict[str, int], col: str, id_map: Dict[str, str]):
     """In place: r[col] = id_map[old] if present (exact/trimmed); leaves value as-is if not found."""
+    idx = col_index[col]
+    id_get = id_map.get
     for r in rows:
-        old = str(r.get(col, "")).strip()
-        if old in id_map:
-            r[col] = id_map[old]
+        new = id_get(r[idx].strip())
+        if new is not None:
+            r[idx] = new
+
+
+def remap_and_map_rows(
+    rows: List[List[str]],
+    col_index: Dict[str, int],
+    id_remaps: List[Tuple[str, Dict[str, str]]],
+    value_mappings: List[Tuple[List[str], Dict[str, str]]],
+    forbid_columns: Set[str] = frozenset()
+) -> Tuple[int, Set[str]]:
+    """
+    Apply remap_column_using_map for each (col, id_map) in id_remaps, then map values
+    (exact key, then trimmed key) for each (columns, mapping) in value_mappings, in that order.
+    Works one target column at a time over rows (called per chunk by remap_and_map_csv): every
+    step only touches its own cell, so results match a row-by-row pass while each inner loop
+    keeps a single column index and bound lookup in locals.
+    Returns (rows_changed_by_value_mapping, unmapped_samples_set)
+    """
+    id_targets = [(col_index[c], m.get) for c, m in id_remaps if c in col_index]
+    value_targets = [
+        (idx, m.get)
+        for cols, m in value_mappings if m
+        for idx in column_indices(col_index, cols, forbid_columns)
+    ]
+
+    changed = bytearray(len(rows))
+    unmapped_samples: Set[str] = set()
+    samples_add = unmapped_samples.add
+    samples_full = False
+    sentinel = object()
+
+    for idx, id_get in id_targets:
+        for r in rows:
+            new = id_get(r[idx].strip())
+            if new is not None:
+                r[idx] = new
+
+    # Exact key, then trimmed key, with a sentinel so mapped-to-empty values still count as hits.
+    for idx, mget in value_targets:
+        for i, r in enumerate(rows):
+            val = r[idx]
+            if val != "":
+                new = mget(val, sentinel)
+                if new is sentinel:
+                    new = mget(val.strip(), sentinel)
+                if new is not sentinel:
+                    r[idx] = new
+                    changed[i] = 1
+                elif not samples_full:
+                    samples_add(val)
+                    samples_full = len(unmapped_samples) >= UNMAPPED_SAMPLE_LIMIT
+
+    changed_rows = changed.count(1)
+    return changed_rows, unmapped_samples
+
+
+def remap_and_map_csv(
+    path: str,
+    out_path: str,
+    headers: List[str],
+    col_index: Dict[str, int],
+    id_remaps: List[Tuple[str, Dict[str, str]]],
+    value_mappings: List[Tuple[List[str], Dict[str, str]]],
+    forbid_columns: Set[str] = frozenset(),
+    chunk_size: int = STREAM_CHUNK_ROWS
+) -> int:
+    """
+    Streaming remap_and_map_rows: read path, apply the remaps/mappings and write out_path
+    holding at most chunk_size rows in memory. headers/col_index come from peek_csv and id maps
+    must be built beforehand. Returns the row count.
+    """
+    count = 0
+
+    def mapped_rows() -> Iterator[List[str]]:
+        nonlocal count
+        for chunk in iter_chunks(iter_csv_rows(path), chunk_size):
+            remap_and_map_rows(chunk, col_index, id_remaps, value_mappings, forbid_columns=forbid_columns)
+            count += len(chunk)
+            yield from chunk
+
+    write_csv_exact_headers(out_path, headers, mapped_rows())
+    return count
+
+
+def process_transactions(
+    path: str,
+    out_path: str,
+    headers: List[str],
+    col_index: Dict[str, int],
+    start_at: int,
+    member_id_map: Dict[str, str],
+    subs_id_map: Dict[str, str],
+    product_cols: List[str],
+    gateway_cols: List[str],
+    products_map: Dict[str, str],
+    gateways_map: Dict[str, str],
+    forbid_columns: Set[str] = frozenset()
+) -> int:
+    """
+    Stream the transactions CSV twice (build its id map, then remap and write); returns the row count.
+    Top-level so it can run in a worker process while members/subscriptions are handled in the parent.
+    """
+    tx_id_map = build_id_map_sequential(iter_csv_rows(path), col_index, "id", start_at)
+    return remap_and_map_csv(
+        path, out_path, headers, col_index,
+        [("id", tx_id_map), ("user_id", member_id_map), ("sub_id", subs_id_map)],
+        [(product_cols, products_map), (gateway_cols, gateways_map)],
+        forbid_columns=forbid_columns,
+    )
 
 
 def main():
@@ -233,11 +379,11 @@ def main():
     except Exception:
         raise SystemExit("start_ids.members / start_ids.subscriptions / start_ids.transactions must be provided as integers.")
 
-    mem_headers, mem_rows = read_csv_keep_order(args.members)
-    sub_headers, sub_rows = read_csv_keep_order(args.subscriptions)
-    tx_headers,  tx_rows  = read_csv_keep_order(args.transactions)
+    mem_headers, mem_index, mem_rows = read_csv_keep_order(args.members)
+    sub_headers, sub_index, sub_has_rows = peek_csv(args.subscriptions)
+    tx_headers,  tx_index,  tx_has_rows  = peek_csv(args.transactions)
 
-    if not (mem_rows or sub_rows or tx_rows):
+    if not (mem_rows or sub_has_rows or tx_has_rows):
         raise SystemExit("No rows found in inputs. Check your CSV paths/exports.")
 
     member_id_col = "ID" if "ID" in mem_headers else ("id" if "id" in mem_headers else None)
@@ -248,41 +394,43 @@ def main():
     if "id" not in tx_headers:
         raise SystemExit("Transactions CSV must have an 'id' column.")
 
-    member_id_map = build_id_map_sequential(mem_rows, member_id_col, start_members)
-    subs_id_map   = build_id_map_sequential(sub_rows, "id", start_subs)
-    tx_id_map     = build_id_map_sequential(tx_rows,  "id", start_txs)
-
-    remap_column_using_map(mem_rows, member_id_col, member_id_map)
-    remap_column_using_map(sub_rows, "id",           subs_id_map)
-    remap_column_using_map(tx_rows,  "id",           tx_id_map)
-
-    if "user_id" in sub_headers:
-        remap_column_using_map(sub_rows, "user_id", member_id_map)
-    if "user_id" in tx_headers:
-        remap_column_using_map(tx_rows, "user_id", member_id_map)
-    if "sub_id" in tx_headers:
-        remap_column_using_map(tx_rows, "sub_id",  subs_id_map)
-
-    apply_multivalue_mapping(mem_rows, product_cols["members"], products_map)
-
-    apply_column_value_mapping(sub_rows, product_cols["subscriptions"], products_map, forbid_columns=hard_forbid_value_columns)
-    apply_column_value_mapping(sub_rows, gateway_cols["subscriptions"], gateways_map, forbid_columns=hard_forbid_value_columns)
-
-    apply_column_value_mapping(tx_rows, product_cols["transactions"], products_map, forbid_columns=hard_forbid_value_columns)
-    apply_column_value_mapping(tx_rows, gateway_cols["transactions"], gateways_map, forbid_columns=hard_forbid_value_columns)
+    member_id_map = build_id_map_sequential(mem_rows, mem_index, member_id_col, start_members)
+    subs_id_map   = build_id_map_sequential(iter_csv_rows(args.subscriptions), sub_index, "id", start_subs)
 
     os.makedirs(args.outdir, exist_ok=True)
     members_out = os.path.join(args.outdir, "members_import.csv")
     subs_out    = os.path.join(args.outdir, "subscriptions_import.csv")
     tx_out      = os.path.join(args.outdir, "transactions_import.csv")
 
-    write_csv_exact_headers(members_out, mem_headers, mem_rows)
-    write_csv_exact_headers(subs_out,    sub_headers, sub_rows)
-    write_csv_exact_headers(tx_out,      tx_headers,  tx_rows)
+    # Transactions (usually the largest file) only need the two id maps, so they are
+    # processed in a worker while members/subscriptions are mapped here. Subscriptions and
+    # transactions are streamed; only members (whose id map everything depends on) is held in memory.
+    with ProcessPoolExecutor(max_workers=1) as ex:
+        tx_future = ex.submit(
+            process_transactions,
+            args.transactions, tx_out, tx_headers, tx_index, start_txs,
+            member_id_map, subs_id_map,
+            product_cols["transactions"], gateway_cols["transactions"],
+            products_map, gateways_map, hard_forbid_value_columns,
+        )
+
+        remap_column_using_map(mem_rows, mem_index, member_id_col, member_id_map)
+        apply_multivalue_mapping(mem_rows, column_indices(mem_index, product_cols["members"]), products_map)
+
+        write_csv_exact_headers(members_out, mem_headers, mem_rows)
+
+        sub_count = remap_and_map_csv(
+            args.subscriptions, subs_out, sub_headers, sub_index,
+            [("id", subs_id_map), ("user_id", member_id_map)],
+            [(product_cols["subscriptions"], products_map), (gateway_cols["subscriptions"], gateways_map)],
+            forbid_columns=hard_forbid_value_columns,
+        )
+
+        tx_count = tx_future.result()
 
     print(f"Members:       {len(mem_rows)} -> {members_out} (ID starts @ {start_members})")
-    print(f"Subscriptions: {len(sub_rows)} -> {subs_out} (id starts @ {start_subs})")
-    print(f"Transactions:  {len(tx_rows)} -> {tx_out} (id starts @ {start_txs})")
+    print(f"Subscriptions: {sub_count} -> {subs_out} (id starts @ {start_subs})")
+    print(f"Transactions:  {tx_count} -> {tx_out} (id starts @ {start_txs})")
     print("Done.")
 
 